@@ -1,24 +1,216 @@
 from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+import jinja2
 import pandas as pd
+import numpy as np
 import uuid
+import threading
 import io
-from typing import Dict
+import csv
+import html
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Annotated, Any, Dict, Iterator, List, Optional, Sequence
+from pydantic import BaseModel
 from topsis_logic import run_topsis, TopsisError
 
-app = FastAPI()
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pyarrow is optional; fall back to the pandas CSV parser
+    pacsv = None
+
+try:
+    import numba
+except ImportError:  # Numba is optional; topsis_logic falls back to NumPy
+    numba = None
+else:
+    # The TOPSIS kernel is launched from threadpool workers: prefer OpenMP,
+    # since TBB can hang interpreter shutdown after launches from non-main threads
+    numba.config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Setup templates
 templates = Jinja2Templates(directory="templates")
+# Templates don't change at runtime: skip the per-render stat check and
+# cache compiled bytecode (in a per-user temp directory) across restarts
+templates.env.auto_reload = False
+templates.env.bytecode_cache = jinja2.FileSystemBytecodeCache()
+
+
+class LRUStore:
+    """Thread-safe in-memory store that evicts the least recently used entry beyond maxsize"""
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# In-memory storage (bounded so long-running servers don't grow without limit)
+DATASTORE = LRUStore(maxsize=128)
+RESULTSTORE = LRUStore(maxsize=128)
+
+# Rows per chunk when streaming the result CSV (one threadpool hop per chunk)
+CSV_BATCH_ROWS = 1000
+
+
+class EchoBuffer:
+    """File-like object whose write returns the value, so csv.writer yields lines"""
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_result_csv(result: Dict[str, Any]) -> Iterator[str]:
+    """Lazily emit a stored TOPSIS result as CSV text, CSV_BATCH_ROWS rows per chunk"""
+    writer = csv.writer(EchoBuffer(), lineterminator='\n')
+    yield writer.writerow(result['header'])
+    
+    ids, values = result['ids'], result['values']
+    scores, ranks, order = result['scores'], result['ranks'], result['order']
+    for start in range(0, len(order), CSV_BATCH_ROWS):
+        rows = order[start:start + CSV_BATCH_ROWS]
+        columns = [ids[rows].tolist(), *(column[rows].tolist() for column in values),
+                   scores[rows].tolist(), ranks[rows].tolist()]
+        yield ''.join([writer.writerow(row) for row in zip(*columns)])
 
-# In-memory storage
-DATASTORE: Dict[str, pd.DataFrame] = {}
-RESULTSTORE: Dict[str, bytes] = {}
+
+def dedup_column_names(names: List[str]) -> List[str]:
+    """Rename repeated headers the way pandas.read_csv does ('a', 'a' -> 'a', 'a.1')"""
+    counts: Dict[str, int] = {}
+    deduped = []
+    for name in names:
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        deduped.append(name)
+        counts[name] = count + 1
+    return deduped
+
+
+def read_dataset(content: bytes, filename: str) -> pd.DataFrame:
+    """Parse uploaded bytes into a DataFrame (multithreaded Arrow parser for CSV when available)"""
+    if filename.endswith('.csv'):
+        if pacsv is not None:
+            table = pacsv.read_csv(pa.BufferReader(content))
+            # Empty headers get pandas' 'Unnamed: <position>' names
+            names = [name or f"Unnamed: {i}" for i, name in enumerate(table.column_names)]
+            return table.rename_columns(dedup_column_names(names)).to_pandas()
+        return pd.read_csv(io.BytesIO(content))
+    return pd.read_excel(io.BytesIO(content))
+
+
+def id_values(ids: pd.Series) -> np.ndarray:
+    """ID column as Python objects, written the way DataFrame.to_csv writes them
+    (datetimes formatted as text, missing IDs as empty fields)"""
+    missing = ids.isna()
+    if ids.dtype.kind in 'mM':
+        ids = ids.astype(str)
+    return ids.astype(object).where(~missing, None).to_numpy()
+
+
+def load_dataset(content: bytes, filename: str) -> SimpleNamespace:
+    """Parse and validate an uploaded dataset into the form kept in DATASTORE"""
+    df = read_dataset(content, filename)
+    
+    # Strip column names
+    df.columns = df.columns.str.strip()
+    
+    # Validate dataset
+    if len(df.columns) < 3:
+        raise TopsisError("Dataset must have at least 3 columns (1 ID column + at least 2 criteria columns)")
+    
+    # First column is ID/Alternative name
+    id_col = df.columns[0]
+    criteria_cols = df.columns[1:]
+    
+    if len(criteria_cols) < 2:
+        raise TopsisError("Dataset must have at least 2 criteria columns")
+    
+    # Check if criteria columns are numeric (from the dtypes alone, so
+    # object columns of numeric strings are rejected as before)
+    for col, dtype in zip(criteria_cols, df.dtypes.iloc[1:]):
+        if not pd.api.types.is_numeric_dtype(dtype):
+            raise TopsisError(f"Column '{col}' must be numeric. All criteria columns must contain numeric values.")
+    
+    # Check for missing and infinite values in criteria columns, on the float64
+    # matrix kept for computation (C-contiguous so each alternative's criteria
+    # are adjacent in memory)
+    criteria_matrix = np.ascontiguousarray(df.iloc[:, 1:].to_numpy(dtype=np.float64, na_value=np.nan))
+    if np.isnan(criteria_matrix).any():
+        raise TopsisError("Missing values detected in criteria columns. Please ensure all criteria columns have complete data.")
+    
+    if not np.isfinite(criteria_matrix).all():
+        raise TopsisError("Infinite values detected in criteria columns. All criteria values must be finite numbers.")
+    
+    # Keep the ID column and the criteria matrix; the DataFrame and uploaded
+    # bytes are not kept. Output columns are views into the matrix, except
+    # for criteria whose original dtype (e.g. int) isn't float64
+    values = tuple(
+        criteria_matrix[:, j] if dtype == np.float64 else df.iloc[:, j + 1].to_numpy()
+        for j, dtype in enumerate(df.dtypes.iloc[1:])
+    )
+    return SimpleNamespace(
+        ids=id_values(df.iloc[:, 0]),
+        id_col=id_col,
+        cols=tuple(criteria_cols),
+        X=criteria_matrix,
+        values=values
+    )
+
+
+def build_criteria_info(criteria_cols: Sequence[str]) -> List[Dict[str, Any]]:
+    """Criteria name and column index for the configuration page (criteria start at column 1)"""
+    return [{'name': col, 'index': i} for i, col in enumerate(criteria_cols, start=1)]
+
+
+def format_cells(values: np.ndarray) -> np.ndarray:
+    """Format a column for the preview: floats as %.6f (via np.char.mod), everything else as-is"""
+    if values.dtype.kind == 'f':
+        return np.char.mod('%.6f', values)
+    return np.array(['' if v is None else html.escape(str(v)) for v in values.tolist()], dtype=object)
+
+
+def render_table_html(result: Dict[str, Any], limit: int = 100) -> str:
+    """Build the preview table of the top-ranked rows without going through pandas"""
+    top = result['order'][:limit]
+    values = result['values']
+    num_criteria = len(values)
+    
+    # Pre-allocated (rows x columns) cell buffer; float columns are formatted
+    # whole with np.char.mod instead of one Python format call per cell
+    cells = np.empty((len(top), num_criteria + 3), dtype=object)
+    cells[:, 0] = format_cells(result['ids'][top])
+    for j, column in enumerate(values, start=1):
+        cells[:, j] = format_cells(column[top])
+    cells[:, num_criteria + 1] = format_cells(result['scores'][top])
+    cells[:, num_criteria + 2] = format_cells(result['ranks'][top])
+    
+    head = ''.join(f'<th>{html.escape(str(col))}</th>' for col in result['header'])
+    body = '\n'.join(['<tr><td>' + '</td><td>'.join(row) + '</td></tr>' for row in cells.tolist()])
+    return f'<table class="result-table"><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>'
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -36,54 +228,18 @@ async def upload_file(request: Request, dataset: UploadFile = File(...)):
         if not (filename.endswith('.csv') or filename.endswith('.xlsx') or filename.endswith('.xls')):
             raise TopsisError("Invalid file format. Please upload a CSV or Excel file (.csv, .xlsx, .xls)")
         
-        # Read file into DataFrame
-        content = await dataset.read()
-        
-        if filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(content))
-        else:
-            df = pd.read_excel(io.BytesIO(content))
-        
-        # Strip column names
-        df.columns = df.columns.str.strip()
-        
-        # Validate dataset
-        if len(df.columns) < 3:
-            raise TopsisError("Dataset must have at least 3 columns (1 ID column + at least 2 criteria columns)")
-        
-        # First column is ID/Alternative name
-        id_col = df.columns[0]
-        criteria_cols = df.columns[1:]
+        # Parse and validate off the event loop
+        data = await run_in_threadpool(load_dataset, await dataset.read(), filename)
         
-        if len(criteria_cols) < 2:
-            raise TopsisError("Dataset must have at least 2 criteria columns")
-        
-        # Check if criteria columns are numeric
-        for col in criteria_cols:
-            if not pd.api.types.is_numeric_dtype(df[col]):
-                raise TopsisError(f"Column '{col}' must be numeric. All criteria columns must contain numeric values.")
-        
-        # Check for missing values in criteria columns
-        if df[criteria_cols].isnull().any().any():
-            raise TopsisError("Missing values detected in criteria columns. Please ensure all criteria columns have complete data.")
-        
-        # Generate token and store dataframe
+        # Generate token and store the validated dataset
         token = str(uuid.uuid4())
-        DATASTORE[token] = df
-        
-        # Prepare criteria information for configuration page
-        criteria_info = []
-        for col in criteria_cols:
-            criteria_info.append({
-                'name': col,
-                'index': list(df.columns).index(col)
-            })
+        DATASTORE[token] = data
         
         return templates.TemplateResponse("configure.html", {
             "request": request,
             "token": token,
-            "criteria": criteria_info,
-            "num_alternatives": len(df)
+            "criteria": build_criteria_info(data.cols),
+            "num_alternatives": len(data.ids)
         })
     
     except TopsisError as e:
@@ -98,29 +254,34 @@ async def upload_file(request: Request, dataset: UploadFile = File(...)):
         })
 
 
+class RunConfig(BaseModel):
+    """Configuration form for /run; weights and impacts are repeated fields, one per criterion.
+    
+    Fields stay raw strings (with empty defaults) so bad input is reported on the
+    configure page by the handler instead of as a validation error response.
+    """
+    token: str = ''
+    weights: List[str] = []
+    impacts: List[str] = []
+
+
 @app.post("/run", response_class=HTMLResponse)
-async def run_topsis_analysis(request: Request):
+async def run_topsis_analysis(request: Request, config: Annotated[RunConfig, Form()]):
     """Run TOPSIS analysis with user-provided weights and impacts"""
+    token = config.token
     try:
-        # Get form data
-        form_data = await request.form()
-        token = form_data.get('token')
-        
-        if not token or token not in DATASTORE:
+        data = DATASTORE.get(token) if token else None
+        if data is None:
             raise TopsisError("Invalid session. Please upload your dataset again.")
         
-        df = DATASTORE[token]
-        criteria_cols = df.columns[1:]
+        criteria_cols = data.cols
         
         # Extract weights and impacts
         weights = []
         impacts = []
         
         for i, col in enumerate(criteria_cols):
-            # Get weight
-            weight_key = f'weight_{i}'
-            weight_value = form_data.get(weight_key)
-            
+            weight_value = config.weights[i] if i < len(config.weights) else ''
             if not weight_value:
                 raise TopsisError(f"Weight for '{col}' is required")
             
@@ -132,58 +293,53 @@ async def run_topsis_analysis(request: Request):
             except ValueError:
                 raise TopsisError(f"Weight for '{col}' must be a positive number")
             
-            # Get impact
-            impact_key = f'impact_{i}'
-            impact_value = form_data.get(impact_key)
-            
-            if impact_value not in ['+', '-']:
+            impact_value = config.impacts[i] if i < len(config.impacts) else ''
+            if impact_value not in ('+', '-'):
                 raise TopsisError(f"Impact for '{col}' must be either '+' (Benefit) or '-' (Cost)")
             
             impacts.append(impact_value)
         
-        # Run TOPSIS
-        result_df = run_topsis(df.copy(), weights, impacts)
+        # Run TOPSIS (off the event loop)
+        scores, ranks, order = await run_in_threadpool(
+            run_topsis, data.X, weights, impacts, criteria_cols
+        )
         
-        # Save result to CSV bytes
-        csv_buffer = io.BytesIO()
-        result_df.to_csv(csv_buffer, index=False)
-        csv_bytes = csv_buffer.getvalue()
-        RESULTSTORE[token] = csv_bytes
+        # Keep result arrays (sharing the uploaded ids/values) for the preview and CSV download
+        result = {
+            'header': [data.id_col, *criteria_cols, 'TOPSIS Score', 'Rank'],
+            'ids': data.ids,
+            'values': data.values,
+            'scores': scores,
+            'ranks': ranks,
+            'order': order
+        }
+        RESULTSTORE[token] = result
         
-        # Find best alternative (Rank = 1)
-        best_row = result_df[result_df['Rank'] == 1].iloc[0]
-        best_id = best_row[df.columns[0]]
+        # Find best alternative (first index in rank order)
+        best_id = data.ids[order[0]]
         
-        # Prepare table preview (first 100 rows)
-        preview_df = result_df.head(100)
+        num_alternatives = len(order)
+        showing_rows = min(num_alternatives, 100)
         
         return templates.TemplateResponse("result.html", {
             "request": request,
             "token": token,
-            "num_alternatives": len(result_df),
+            "num_alternatives": num_alternatives,
             "best_id": best_id,
-            "table_html": preview_df.to_html(classes='result-table', index=False, float_format='%.6f'),
-            "total_rows": len(result_df),
-            "showing_rows": len(preview_df)
+            "table_html": render_table_html(result, limit=showing_rows),
+            "total_rows": num_alternatives,
+            "showing_rows": showing_rows
         })
     
     except TopsisError as e:
         # If error occurs, try to re-render configure page with error
-        if token and token in DATASTORE:
-            df = DATASTORE[token]
-            criteria_cols = df.columns[1:]
-            criteria_info = []
-            for col in criteria_cols:
-                criteria_info.append({
-                    'name': col,
-                    'index': list(df.columns).index(col)
-                })
-            
+        data = DATASTORE.get(token) if token else None
+        if data is not None:
             return templates.TemplateResponse("configure.html", {
                 "request": request,
                 "token": token,
-                "criteria": criteria_info,
-                "num_alternatives": len(df),
+                "criteria": build_criteria_info(data.cols),
+                "num_alternatives": len(data.ids),
                 "error": str(e)
             })
         else:
@@ -201,13 +357,15 @@ async def run_topsis_analysis(request: Request):
 @app.get("/download")
 async def download_result(token: str):
     """Download TOPSIS result as CSV"""
-    if token not in RESULTSTORE:
-        return {"error": "Result not found. Please run TOPSIS analysis first."}
-    
-    csv_bytes = RESULTSTORE[token]
+    result = RESULTSTORE.get(token)
+    if result is None:
+        return ORJSONResponse(
+            {"error": "Result not found. Please run TOPSIS analysis first."},
+            status_code=404
+        )
     
     return StreamingResponse(
-        io.BytesIO(csv_bytes),
+        iter_result_csv(result),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=topsis_result.csv"}
     )
\ No newline at end of file
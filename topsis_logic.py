@@ -1,6 +1,15 @@
-import pandas as pd
+import threading
 import numpy as np
-from typing import List
+from typing import List, Sequence, Tuple
+
+try:
+    from numba import njit, prange, types
+except ImportError:  # Numba is optional; fall back to the NumPy implementation
+    njit = None
+
+
+# Rows per block in the NumPy fallback of the distance computation
+FALLBACK_BLOCK_ROWS = 4096
 
 
 class TopsisError(Exception):
@@ -8,29 +17,58 @@ class TopsisError(Exception):
     pass
 
 
-def run_topsis(df: pd.DataFrame, weights: List[float], impacts: List[str]) -> pd.DataFrame:
+if njit is not None:
+    # Kernel launches are serialized: the workqueue threading layer isn't
+    # threadsafe, and run_topsis is called from web worker threads (the web
+    # app picks the threading layer itself, see main.py)
+    _kernel_lock = threading.Lock()
+    
+    # Explicit signatures compile the kernel at import instead of on the first
+    # run; cache=True keeps the compiled kernel on disk across process restarts.
+    # X is typed read-only so that read-only arrays (e.g. from DataFrame.to_numpy
+    # under copy-on-write) are accepted as well as writable ones.
+    # No fastmath: reassociated sums would break exact score ties (rank method='min')
+    @njit([types.void(types.Array(dtype, 2, 'C', readonly=True), *[types.float64[::1]] * 5)
+           for dtype in (types.float64, types.float32)],
+          parallel=True, cache=True)
+    def topsis_kernel(X, scale, ideal_best, ideal_worst, s_plus, s_minus):
+        """Fused weighting + separation distances: one pass over X, no (m, n) temporaries"""
+        for i in prange(X.shape[0]):
+            sp = 0.0
+            sm = 0.0
+            for j in range(X.shape[1]):
+                v = X[i, j] * scale[j]
+                sp += (v - ideal_best[j]) ** 2
+                sm += (v - ideal_worst[j]) ** 2
+            s_plus[i] = np.sqrt(sp)
+            s_minus[i] = np.sqrt(sm)
+else:
+    topsis_kernel = None
+
+
+def run_topsis(criteria_matrix: np.ndarray, weights: List[float], impacts: List[str],
+               criteria_cols: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Run TOPSIS algorithm on the given dataframe
+    Run TOPSIS algorithm on the given criteria matrix
     
     Parameters:
     -----------
-    df : pd.DataFrame
-        DataFrame with first column as ID/Alternative and remaining as criteria
+    criteria_matrix : np.ndarray
+        (alternatives x criteria) numeric matrix, e.g. the float64 matrix stored at upload
     weights : List[float]
         List of weights for each criterion (must be positive)
     impacts : List[str]
         List of impacts ('+' for benefit, '-' for cost) for each criterion
+    criteria_cols : Sequence[str]
+        Names of the criteria columns, in matrix column order (used in error messages)
     
     Returns:
     --------
-    pd.DataFrame
-        Original dataframe with added 'TOPSIS Score' and 'Rank' columns
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        (scores, ranks, order): TOPSIS score and rank per row in input order, and
+        the row indices sorted by rank (best first). The input matrix is not modified.
     """
     
-    # Extract ID column and criteria columns
-    id_col = df.columns[0]
-    criteria_cols = df.columns[1:]
-    
     # Validate inputs
     if len(weights) != len(criteria_cols):
         raise TopsisError(f"Number of weights ({len(weights)}) must match number of criteria columns ({len(criteria_cols)})")
@@ -38,49 +76,57 @@ def run_topsis(df: pd.DataFrame, weights: List[float], impacts: List[str]) -> pd
     if len(impacts) != len(criteria_cols):
         raise TopsisError(f"Number of impacts ({len(impacts)}) must match number of criteria columns ({len(criteria_cols)})")
     
-    # Extract criteria matrix
-    criteria_matrix = df[criteria_cols].values
-    
-    # Step 1: Vector Normalization
-    # For each column j: norm_ij = x_ij / sqrt(sum_i x_ij^2)
-    normalized_matrix = np.zeros_like(criteria_matrix, dtype=float)
+    # Step 1 + 2: Vector Normalization fused with Weighting
+    # norm_ij = x_ij / sqrt(sum_i x_ij^2), v_ij = norm_ij * w_j
+    # Folded into a single per-column scale: v_ij = x_ij * (w_j / sqrt(sum_i x_ij^2))
+    # Accumulate in float64 whatever the input dtype
+    sq_norms = np.einsum('ij,ij->j', criteria_matrix, criteria_matrix, dtype=np.float64)
     
-    for j in range(criteria_matrix.shape[1]):
-        column = criteria_matrix[:, j]
-        sum_of_squares = np.sum(column ** 2)
-        
-        if sum_of_squares == 0:
-            raise TopsisError(f"Column '{criteria_cols[j]}' has all zeros, cannot normalize")
-        
-        normalized_matrix[:, j] = column / np.sqrt(sum_of_squares)
+    if (sq_norms == 0).any():
+        zero_col = criteria_cols[int(np.argmax(sq_norms == 0))]
+        raise TopsisError(f"Column '{zero_col}' has all zeros, cannot normalize")
     
-    # Step 2: Weighted Normalized Matrix
-    # v_ij = norm_ij * w_j
-    weights_array = np.array(weights)
-    weighted_matrix = normalized_matrix * weights_array
+    scale = np.asarray(weights, dtype=np.float64) / np.sqrt(sq_norms)
     
     # Step 3: Determine Ideal Best and Ideal Worst
-    ideal_best = np.zeros(len(criteria_cols))
-    ideal_worst = np.zeros(len(criteria_cols))
-    
-    for j, impact in enumerate(impacts):
-        if impact == '+':
-            # Benefit: best is maximum, worst is minimum
-            ideal_best[j] = np.max(weighted_matrix[:, j])
-            ideal_worst[j] = np.min(weighted_matrix[:, j])
-        elif impact == '-':
-            # Cost: best is minimum, worst is maximum
-            ideal_best[j] = np.min(weighted_matrix[:, j])
-            ideal_worst[j] = np.max(weighted_matrix[:, j])
-        else:
-            raise TopsisError(f"Invalid impact value '{impact}'. Must be '+' or '-'")
+    invalid_impacts = [impact for impact in impacts if impact not in ('+', '-')]
+    if invalid_impacts:
+        raise TopsisError(f"Invalid impact value '{invalid_impacts[0]}'. Must be '+' or '-'")
+    
+    # Column extremes of the weighted matrix, taken from the raw matrix
+    # (max/min swap if a scale factor is negative)
+    scaled_max = criteria_matrix.max(axis=0) * scale
+    scaled_min = criteria_matrix.min(axis=0) * scale
+    col_max = np.maximum(scaled_max, scaled_min)
+    col_min = np.minimum(scaled_max, scaled_min)
+    
+    # Benefit (+): best is maximum, worst is minimum
+    # Cost (-): best is minimum, worst is maximum
+    is_benefit = np.array([impact == '+' for impact in impacts])
+    ideal_best = np.where(is_benefit, col_max, col_min)
+    ideal_worst = np.where(is_benefit, col_min, col_max)
     
     # Step 4: Calculate Separation Distances
     # S+ = sqrt(sum_j (v_ij - ideal_best_j)^2)
     # S- = sqrt(sum_j (v_ij - ideal_worst_j)^2)
-    
-    s_plus = np.sqrt(np.sum((weighted_matrix - ideal_best) ** 2, axis=1))
-    s_minus = np.sqrt(np.sum((weighted_matrix - ideal_worst) ** 2, axis=1))
+    if (topsis_kernel is not None and criteria_matrix.dtype in (np.float32, np.float64)
+            and criteria_matrix.flags.c_contiguous):
+        s_plus = np.empty(criteria_matrix.shape[0])
+        s_minus = np.empty(criteria_matrix.shape[0])
+        with _kernel_lock:
+            topsis_kernel(criteria_matrix, scale, ideal_best, ideal_worst, s_plus, s_minus)
+    else:
+        # Differences are computed directly (the expanded-norm form loses
+        # precision on data with a large offset), one block of rows at a time
+        # so temporaries stay bounded at (FALLBACK_BLOCK_ROWS, n)
+        num_rows = criteria_matrix.shape[0]
+        s_plus = np.empty(num_rows)
+        s_minus = np.empty(num_rows)
+        for start in range(0, num_rows, FALLBACK_BLOCK_ROWS):
+            stop = start + FALLBACK_BLOCK_ROWS
+            block = criteria_matrix[start:stop] * scale
+            s_plus[start:stop] = np.sqrt(np.square(block - ideal_best).sum(axis=1))
+            s_minus[start:stop] = np.sqrt(np.square(block - ideal_worst).sum(axis=1))
     
     # Step 5: Calculate TOPSIS Score
     # score_i = S- / (S+ + S-)
@@ -92,15 +138,31 @@ def run_topsis(df: pd.DataFrame, weights: List[float], impacts: List[str]) -> pd
     
     topsis_scores = s_minus / denominator
     
+    # Infinite criteria values give NaN scores, which would still be ranked
+    if not np.isfinite(topsis_scores).all():
+        raise TopsisError("Non-finite TOPSIS scores encountered; all criteria values must be finite numbers")
+    
     # Step 6: Rank alternatives
     # Higher score = better; Rank 1 = highest score
-    ranks = pd.Series(topsis_scores).rank(ascending=False, method='min').astype(int)
+    ranks, order = rank_scores(topsis_scores)
     
-    # Add TOPSIS Score and Rank to dataframe
-    df['TOPSIS Score'] = topsis_scores
-    df['Rank'] = ranks
-    
-    # Sort by Rank for better readability
-    df = df.sort_values('Rank')
+    return topsis_scores, ranks, order
+
+
+def rank_scores(scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rank scores in descending order the way pandas rank(ascending=False, method='min') does
     
-    return df
\ No newline at end of file
+    Returns (ranks, order): tied scores share the lowest rank of their group, and
+    order lists row indices best first (ties keep their input order).
+    """
+    order = np.argsort(-scores, kind='stable')
+    sorted_scores = scores[order]
+    positions = np.arange(len(order))
+    is_group_start = np.empty(len(order), dtype=bool)
+    is_group_start[:1] = True
+    is_group_start[1:] = sorted_scores[1:] != sorted_scores[:-1]
+    group_start = np.maximum.accumulate(np.where(is_group_start, positions, 0))
+    ranks = np.empty_like(order)
+    ranks[order] = group_start + 1
+    return ranks, order
\ No newline at end of file